@@ -1,21 +1,245 @@
 #!/usr/bin/env python3
 """Embedding server using sentence-transformers MiniLM."""
-from flask import Flask, request, jsonify
-from sentence_transformers import SentenceTransformer
+import asyncio
+import fcntl
+import os
+import shutil
+import tempfile
+from contextlib import asynccontextmanager
+from pathlib import Path
 
-app = Flask(__name__)
-model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+import numpy as np
+import orjson
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import Response
 
-@app.route("/health")
-def health():
-    return jsonify({"status": "ok"})
+MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+MODEL_BACKEND = os.environ.get("MODEL_BACKEND", "torch")
+TORCH_BF16 = os.environ.get("TORCH_BF16") == "1"
+# Cores are split evenly between worker processes so their GEMM threads don't oversubscribe
+EMBED_WORKERS = int(os.environ.get("EMBED_WORKERS", "1"))
+THREADS_PER_WORKER = max(1, os.cpu_count() // EMBED_WORKERS)
+CACHE_DIR = Path(os.environ.get("MODEL_CACHE_DIR", "/app/cache"))
+CACHE_MARKER = ".complete"
+MAX_SEQ_LENGTH = 256
+ENCODE_BATCH_SIZE = 64
 
-@app.route("/embed", methods=["POST"])
-def embed():
-    texts = request.json.get("inputs", [])
+
+def cached_model_dir(name, build):
+    """Return CACHE_DIR/name, running build(dir) once to create it.
+
+    The build happens in a staging dir on the same filesystem and is published with a
+    single rename, so an interrupted build never looks like a valid cache. A file lock
+    lets only one process build; the others wait and reuse its result.
+    """
+    model_dir = CACHE_DIR / name
+    if (model_dir / CACHE_MARKER).exists():
+        return model_dir
+
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    with open(CACHE_DIR / f".{name}.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if (model_dir / CACHE_MARKER).exists():
+            return model_dir
+
+        staging = Path(tempfile.mkdtemp(dir=CACHE_DIR, prefix=f".{name}-"))
+        try:
+            build(staging)
+            (staging / CACHE_MARKER).touch()
+            # Leftovers from an interrupted build (no marker) are replaced
+            shutil.rmtree(model_dir, ignore_errors=True)
+            os.replace(staging, model_dir)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+    return model_dir
+
+
+def load_torch():
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    torch.set_num_threads(THREADS_PER_WORKER)
+    model = SentenceTransformer(MODEL_NAME, device="cpu")
+    if TORCH_BF16:
+        # bf16 GEMMs on AVX-512-BF16/AMX CPUs; opt-in until recall is checked on your queries
+        model = model.to(torch.bfloat16)
+
+    def encode(texts):
+        return model.encode(texts, batch_size=ENCODE_BATCH_SIZE, show_progress_bar=False, convert_to_numpy=True, normalize_embeddings=True)
+
+    return encode
+
+
+def prepare_onnx():
+    """Dynamic-INT8 quantized ONNX export, quantized once and cached on disk."""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from onnxruntime.transformers.optimizer import optimize_model
+    from optimum.onnxruntime import ORTModelForFeatureExtraction
+
+    def build(out):
+        with tempfile.TemporaryDirectory(dir=out) as tmp:
+            tmp = Path(tmp)
+            ORTModelForFeatureExtraction.from_pretrained(MODEL_NAME, export=True).save_pretrained(tmp)
+            # Fuse Attention/SkipLayerNorm/EmbedLayerNorm before quantizing the fused MatMuls
+            optimize_model(str(tmp / "model.onnx"), model_type="bert", num_heads=12, hidden_size=384).save_model_to_file(str(tmp / "model_optimized.onnx"))
+            # QInt8 weights: QUInt8 hits the slow u8u8 kernels on x86
+            quantize_dynamic(tmp / "model_optimized.onnx", out / "model_quantized.onnx", weight_type=QuantType.QInt8)
+            shutil.copy(tmp / "config.json", out / "config.json")
+
+    return cached_model_dir(MODEL_NAME.replace("/", "--"), build)
+
+
+def load_onnx():
+    import onnxruntime
+    from optimum.onnxruntime import ORTModelForFeatureExtraction
+
+    session_options = onnxruntime.SessionOptions()
+    session_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    session_options.intra_op_num_threads = THREADS_PER_WORKER
+    model = ORTModelForFeatureExtraction.from_pretrained(
+        prepare_onnx(), file_name="model_quantized.onnx",
+        session_options=session_options, provider="CPUExecutionProvider",
+    )
+    return mean_pooled_encoder(model)
+
+
+def prepare_openvino():
+    """OpenVINO IR export with int8 weights, exported once and cached on disk."""
+    from optimum.intel import OVModelForFeatureExtraction, OVWeightQuantizationConfig
+
+    def build(out):
+        OVModelForFeatureExtraction.from_pretrained(
+            MODEL_NAME, export=True, quantization_config=OVWeightQuantizationConfig(bits=8),
+        ).save_pretrained(out)
+
+    return cached_model_dir(MODEL_NAME.replace("/", "--") + "-openvino", build)
+
+
+def load_openvino():
+    from optimum.intel import OVModelForFeatureExtraction
+
+    model = OVModelForFeatureExtraction.from_pretrained(prepare_openvino(), ov_config={"INFERENCE_NUM_THREADS": str(THREADS_PER_WORKER)})
+    return mean_pooled_encoder(model)
+
+
+def mean_pooled_encoder(model):
+    """encode() for an optimum feature-extraction model: tokenize, forward, mean pool, normalize."""
+    import torch
+    import torch.nn.functional as F
+    from transformers import AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME, use_fast=True)
+
+    def encode_batch(texts):
+        inputs = tokenizer(texts, padding=True, truncation=True, max_length=MAX_SEQ_LENGTH, return_tensors="pt")
+        with torch.no_grad():
+            token_embeddings = model(**inputs).last_hidden_state
+        # Broadcast the mask rather than materializing a B x T x H copy of it
+        mask = inputs["attention_mask"].unsqueeze(-1).to(token_embeddings.dtype)
+        summed = (token_embeddings * mask).sum(1)
+        counts = mask.sum(1).clamp(min=1)
+        return F.normalize(summed / counts, p=2, dim=1).numpy()
+
+    def encode(texts):
+        # Fixed-size forward passes bound the attention activations, and sorting by length
+        # keeps padding within each pass small, as SentenceTransformer.encode does
+        order = np.argsort([-len(text) for text in texts], kind="stable")
+        ordered = [texts[i] for i in order]
+        embeddings = np.concatenate([
+            encode_batch(ordered[i:i + ENCODE_BATCH_SIZE]) for i in range(0, len(ordered), ENCODE_BATCH_SIZE)
+        ])
+        return embeddings[np.argsort(order)]
+
+    return encode
+
+
+BACKENDS = {"torch": load_torch, "onnx": load_onnx, "openvino": load_openvino}
+# Backends whose exported model is built into CACHE_DIR on first use
+PREPARE = {"onnx": prepare_onnx, "openvino": prepare_openvino}
+
+# Concurrent /embed calls are coalesced into one encode() so the GEMM sees a larger batch
+BATCH_WINDOW = 0.005
+MAX_BATCH_TEXTS = 256
+
+
+async def batch_worker(queue, encode):
+    loop = asyncio.get_running_loop()
+    while True:
+        pending = [await queue.get()]
+        size = len(pending[0][0])
+        deadline = loop.time() + BATCH_WINDOW
+        while size < MAX_BATCH_TEXTS and (timeout := deadline - loop.time()) > 0:
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            pending.append(item)
+            size += len(item[0])
+
+        texts = [text for batch, _ in pending for text in batch]
+        try:
+            embeddings = await loop.run_in_executor(None, encode, texts)
+        except Exception:
+            # Retry each request on its own so one bad input only fails its own caller
+            for batch, future in pending:
+                await encode_one(loop, encode, batch, future)
+            continue
+
+        offset = 0
+        for batch, future in pending:
+            if not future.done():
+                future.set_result(embeddings[offset:offset + len(batch)])
+            offset += len(batch)
+
+
+async def encode_one(loop, encode, texts, future):
+    try:
+        embeddings = await loop.run_in_executor(None, encode, texts)
+    except Exception as e:
+        if not future.done():
+            future.set_exception(e)
+        return
+    if not future.done():
+        future.set_result(embeddings)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Loaded per worker process, after uvicorn spawns it: ORT/OpenVINO thread pools don't survive a fork
+    encode = BACKENDS[MODEL_BACKEND]()
+    app.state.queue = asyncio.Queue()
+    worker = asyncio.create_task(batch_worker(app.state.queue, encode))
+    yield
+    worker.cancel()
+
+
+app = FastAPI(lifespan=lifespan)
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+@app.post("/embed")
+async def embed(request: Request):
+    body = await request.json()
+    texts = body.get("inputs", []) if isinstance(body, dict) else None
+    if isinstance(texts, str):
+        texts = [texts]
+    if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+        return Response(
+            orjson.dumps({"error": "inputs must be a string or a list of strings"}),
+            status_code=422, media_type="application/json",
+        )
     if not texts:
-        return jsonify([])
-    return jsonify(model.encode(texts, convert_to_numpy=True, normalize_embeddings=True).tolist())
+        return Response(b"[]", media_type="application/json")
+    future = asyncio.get_running_loop().create_future()
+    await request.app.state.queue.put((texts, future))
+    # Serialize the ndarray directly instead of building ~384 Python floats per row
+    return Response(orjson.dumps(await future, option=orjson.OPT_SERIALIZE_NUMPY), media_type="application/json")
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=8080)
+    # Build the exported model once here, before uvicorn starts the workers that load it
+    if MODEL_BACKEND in PREPARE:
+        PREPARE[MODEL_BACKEND]()
+    uvicorn.run("main:app", host="0.0.0.0", port=8080, workers=EMBED_WORKERS)
@@ -1,8 +1,10 @@
-use std::collections::HashSet;
+use std::collections::{HashMap, HashSet};
 use std::env;
 use std::fs;
+use std::io::Read;
 use std::path::{Path, PathBuf};
-use std::sync::{mpsc, Arc, Mutex};
+use std::sync::atomic::{AtomicUsize, Ordering};
+use std::sync::mpsc;
 use std::thread;
 
 use anyhow::{Context, Result};
@@ -22,7 +24,7 @@ const ALWAYS_IGNORE_DIRS: &[&str] = &[
     "code-signing", ".reassure", ".vscode", ".claude", "build", "Pods",
     ".gradle", "node_modules", "dist", "coverage", ".next", ".cache",
     "tmp", "temp", "target", "test-utils", "__fixture__", "Locales",
-    "translations", "generated", "cache", "logs",
+    "translations", "generated", "cache", "logs", "__tests__",
 ];
 
 const BINARY_EXTENSIONS: &[&str] = &[
@@ -44,25 +46,31 @@ const ALWAYS_IGNORE_FILES: &[&str] = &[
     "Cargo.lock", ".eslintrc", ".prettierrc", ".npmignore", ".gitignore",
 ];
 
+// Skip large files (>10MB)
+const MAX_FILE_SIZE: u64 = 10 * 1024 * 1024;
+
 const ALLOWED_NO_EXTENSION: &[&str] = &["Makefile", "Dockerfile", "Gemfile", "Rakefile", "Podfile", "Containerfile"];
 
 // ============================================================================
 // File Utilities
 // ============================================================================
 
-fn should_index_file(path: &Path) -> bool {
-    let file_name = path.file_name().and_then(|n| n.to_str()).unwrap_or("");
+fn should_index_file(file_name: &str) -> bool {
     let file_name_lower = file_name.to_lowercase();
 
-    if ALWAYS_IGNORE_FILES.iter().any(|f| file_name_lower == f.to_lowercase()) {
+    if ALWAYS_IGNORE_FILES.iter().any(|f| f.eq_ignore_ascii_case(file_name)) {
         return false;
     }
 
-    if let Some(ext) = path.extension().and_then(|e| e.to_str()) {
-        let ext_with_dot = format!(".{}", ext.to_lowercase());
-        if BINARY_EXTENSIONS.contains(&ext_with_dot.as_str()) {
-            return false;
-        }
+    // Lowercased extension with its dot, sliced from the name that was lowercased once above.
+    // Like Path::extension, a leading dot (".env") does not start an extension.
+    let ext_lower = match file_name_lower.rfind('.') {
+        Some(i) if i > 0 => Some(&file_name_lower[i..]),
+        _ => None,
+    };
+
+    if ext_lower.is_some_and(|ext| BINARY_EXTENSIONS.contains(&ext)) {
+        return false;
     }
 
     for pattern in GENERATED_EXTENSIONS {
@@ -75,17 +83,26 @@ fn should_index_file(path: &Path) -> bool {
         return false;
     }
 
-    if path.components().any(|c| c.as_os_str() == "__tests__") {
-        return false;
-    }
-
-    if path.extension().is_none() && !ALLOWED_NO_EXTENSION.contains(&file_name) {
+    if ext_lower.is_none() && !ALLOWED_NO_EXTENSION.contains(&file_name) {
         return false;
     }
 
     true
 }
 
+/// Reads a file for indexing, skipping files over MAX_FILE_SIZE.
+/// The size comes from fstat on the open handle, so the serial directory walk
+/// never has to stat files itself.
+fn read_source_file(path: &Path) -> Option<String> {
+    let mut file = fs::File::open(path).ok()?;
+    if file.metadata().ok()?.len() > MAX_FILE_SIZE {
+        return None;
+    }
+    let mut content = String::new();
+    file.read_to_string(&mut content).ok()?;
+    Some(content)
+}
+
 fn load_gitignore(directory: &Path) -> Option<Gitignore> {
     let gitignore_path = directory.join(".gitignore");
     if gitignore_path.exists() {
@@ -134,6 +151,21 @@ impl EmbeddingClient {
             return Ok(Vec::new());
         }
 
+        // Embed each distinct text once (license headers, boilerplate) and fan the vectors back out
+        let mut index: HashMap<&str, usize> = HashMap::with_capacity(texts.len());
+        let mut unique: Vec<&str> = Vec::with_capacity(texts.len());
+        let slots: Vec<usize> = texts.iter()
+            .map(|&t| *index.entry(t).or_insert_with(|| { unique.push(t); unique.len() - 1 }))
+            .collect();
+
+        let embeddings = self.request_embeddings(&unique)?;
+        if unique.len() == texts.len() {
+            return Ok(embeddings);
+        }
+        Ok(slots.iter().map(|&i| embeddings[i].clone()).collect())
+    }
+
+    fn request_embeddings(&self, texts: &[&str]) -> Result<Vec<Vec<f32>>> {
         let request = EmbedRequest {
             inputs: texts.iter().map(|s| s.to_string()).collect(),
         };
@@ -173,6 +205,12 @@ pub struct Chunk {
     pub metadata: ChunkMetadata,
 }
 
+struct FileContext<'a> {
+    file_path: &'a str,
+    file_type: String,
+    id_prefix: String,
+}
+
 pub struct CodeChunker {
     git_commit: String,
     git_branch: String,
@@ -188,38 +226,42 @@ impl CodeChunker {
         let overlap = 500;
         let lines: Vec<&str> = content.lines().collect();
         let mut chunks = Vec::new();
-        let mut current_chunk: Vec<&str> = Vec::new();
-        let mut current_size = 0usize;
-        let mut start_line = 1usize;
-
-        for (i, line) in lines.iter().enumerate() {
-            let line_size = line.len() + 1;
+        if lines.is_empty() {
+            return chunks;
+        }
 
-            if current_size + line_size > chunk_size && !current_chunk.is_empty() {
-                chunks.push(self.create_chunk(file_path, &current_chunk, start_line));
+        // offsets[k] = byte size of lines[..k] (each line counted with its newline)
+        let mut offsets = Vec::with_capacity(lines.len() + 1);
+        offsets.push(0usize);
+        for line in &lines {
+            offsets.push(offsets[offsets.len() - 1] + line.len() + 1);
+        }
 
-                let overlap_lines = self.get_overlap_lines(&current_chunk, overlap);
-                let overlap_count = overlap_lines.len();
-                current_chunk = overlap_lines;
-                current_size = current_chunk.iter().map(|l| l.len() + 1).sum();
-                start_line = i + 1 - overlap_count;
+        let file = self.file_context(file_path);
+        let mut start = 0usize;
+        let mut min_end = 1usize;
+        loop {
+            // Largest end with offsets[end] - offsets[start] <= chunk_size, but never
+            // shorter than the line that forced the previous split
+            let limit = offsets[start] + chunk_size;
+            let end = (offsets.partition_point(|&o| o <= limit) - 1).max(min_end);
+            if end >= lines.len() {
+                chunks.push(self.create_chunk(&file, &lines[start..], start + 1));
+                break;
             }
+            chunks.push(self.create_chunk(&file, &lines[start..end], start + 1));
 
-            current_chunk.push(line);
-            current_size += line_size;
-        }
-
-        if !current_chunk.is_empty() {
-            chunks.push(self.create_chunk(file_path, &current_chunk, start_line));
+            // Longest tail of the chunk that fits in the overlap budget
+            let overlap_floor = offsets[end].saturating_sub(overlap);
+            start = offsets.partition_point(|&o| o < overlap_floor).max(start);
+            min_end = end + 1;
         }
 
         chunks
     }
 
-    fn create_chunk(&self, file_path: &str, lines: &[&str], start_line: usize) -> Chunk {
-        let end_line = start_line + lines.len() - 1;
-        let chunk_text = lines.join("\n");
-
+    /// Values shared by every chunk of a file, computed once per file rather than per chunk.
+    fn file_context<'a>(&self, file_path: &'a str) -> FileContext<'a> {
         let file_type = Path::new(file_path)
             .extension()
             .and_then(|e| e.to_str())
@@ -227,37 +269,31 @@ impl CodeChunker {
             .unwrap_or_default();
 
         let commit_prefix = if self.git_commit.len() >= 8 { &self.git_commit[..8] } else { &self.git_commit };
-        let id = format!("{}_{}_{}_{}_{}",
+        let id_prefix = format!("{}_{}_{}",
             self.git_branch, commit_prefix,
-            file_path.replace('/', "_").replace('.', "_"),
-            start_line, end_line
+            file_path.replace('/', "_").replace('.', "_")
         );
 
+        FileContext { file_path, file_type, id_prefix }
+    }
+
+    fn create_chunk(&self, file: &FileContext, lines: &[&str], start_line: usize) -> Chunk {
+        let end_line = start_line + lines.len() - 1;
+        let chunk_text = lines.join("\n");
+
         Chunk {
-            id,
+            id: format!("{}_{}_{}", file.id_prefix, start_line, end_line),
             text: chunk_text,
             metadata: ChunkMetadata {
-                file_path: file_path.to_string(),
+                file_path: file.file_path.to_string(),
                 start_line,
                 end_line,
-                file_type,
+                file_type: file.file_type.clone(),
                 git_commit: self.git_commit.clone(),
                 git_branch: self.git_branch.clone(),
             },
         }
     }
-
-    fn get_overlap_lines<'a>(&self, current_chunk: &[&'a str], overlap: usize) -> Vec<&'a str> {
-        let mut overlap_lines = Vec::new();
-        let mut overlap_size = 0usize;
-        for line in current_chunk.iter().rev() {
-            let line_size = line.len() + 1;
-            if overlap_size + line_size > overlap { break; }
-            overlap_lines.insert(0, *line);
-            overlap_size += line_size;
-        }
-        overlap_lines
-    }
 }
 
 // ============================================================================
@@ -391,34 +427,22 @@ impl ChromaClient {
 
     pub fn delete_old_commits(&self, git_branch: &str, current_commit: &str) -> Result<usize> {
         let collection_id = self.collection_id.as_ref().context("Collection not initialized")?;
-        let url = format!("{}/collections/{}/get", self.base_url, collection_id);
+        let url = format!("{}/collections/{}/delete", self.base_url, collection_id);
 
-        let request = ChromaQueryRequest {
-            r#where: Some(serde_json::json!({
+        // Filter server-side in one call instead of fetching the matching ids and deleting them in pages
+        let before = self.count();
+        let body = serde_json::json!({
+            "where": {
                 "$and": [{"git_branch": {"$eq": git_branch}}, {"git_commit": {"$ne": current_commit}}]
-            })),
-            limit: Some(50000),
-            include: vec![],
-        };
+            }
+        });
 
-        let response = self.client.post(&url).json(&request).send()?;
+        let response = self.client.post(&url).json(&body).send()?;
         if !response.status().is_success() {
             return Ok(0);
         }
 
-        let result: ChromaQueryResponse = response.json()?;
-        if result.ids.is_empty() {
-            return Ok(0);
-        }
-
-        let count = result.ids.len();
-        for chunk_ids in result.ids.chunks(1000) {
-            let delete_url = format!("{}/collections/{}/delete", self.base_url, collection_id);
-            let delete_body = serde_json::json!({ "ids": chunk_ids });
-            self.client.post(&delete_url).json(&delete_body).send()?;
-        }
-
-        Ok(count)
+        Ok(before.saturating_sub(self.count()))
     }
 
     pub fn count(&self) -> usize {
@@ -483,55 +507,74 @@ impl CodebaseIndexer {
             return Ok(());
         }
 
-        // Process files in parallel to generate chunks
-        let processed = Arc::new(Mutex::new(0usize));
+        // Chunk files in parallel, embed on this thread and upload on another, with
+        // bounded channels between stages so only a few batches are ever in memory
+        let processed = AtomicUsize::new(0);
         let total = files.len();
+        let mut chunk_count = 0usize;
 
-        let chunks: Vec<Chunk> = files
-            .par_iter()
-            .filter_map(|path| {
-                let content = fs::read_to_string(path).ok()?;
-                if content.is_empty() { return None; }
+        thread::scope(|s| -> Result<()> {
+            let (chunk_tx, chunk_rx) = mpsc::sync_channel::<Vec<Chunk>>(batch_size);
+            let (upload_tx, upload_rx) = mpsc::sync_channel::<(Vec<Chunk>, Vec<Vec<f32>>)>(2);
 
-                let relative = path.strip_prefix(directory).unwrap_or(path).to_string_lossy().to_string();
-                let file_chunks = self.chunker.chunk_code(&content, &relative);
+            let (files, processed) = (&files, &processed);
+            s.spawn(move || {
+                files.par_iter().for_each_with(chunk_tx, |tx, path| {
+                    let Some(content) = read_source_file(path) else { return };
+                    if content.is_empty() { return; }
 
-                let mut count = processed.lock().unwrap();
-                *count += 1;
-                if *count % 100 == 0 {
-                    println!("Processed {}/{} files", *count, total);
-                }
-
-                Some(file_chunks)
-            })
-            .flatten()
-            .collect();
+                    let relative = path.strip_prefix(directory).unwrap_or(path).to_string_lossy().to_string();
+                    let file_chunks = self.chunker.chunk_code(&content, &relative);
 
-        println!("Generated {} chunks", chunks.len());
-
-        // Upload with pipelining
-        let total_batches = (chunks.len() + batch_size - 1) / batch_size;
-        let batches: Vec<_> = chunks.chunks(batch_size).collect();
+                    let count = processed.fetch_add(1, Ordering::Relaxed) + 1;
+                    if count % 100 == 0 {
+                        println!("Processed {}/{} files", count, total);
+                    }
 
-        let (tx, rx) = mpsc::channel::<(Vec<Chunk>, Vec<Vec<f32>>)>();
-        let chroma = self.chroma.clone();
+                    // Fails only once the embedding loop has bailed out
+                    tx.send(file_chunks).ok();
+                });
+            });
 
-        let upload_thread = thread::spawn(move || -> Result<()> {
-            while let Ok((chunks, embeddings)) = rx.recv() {
-                chroma.add_chunks(&chunks, embeddings)?;
-            }
-            Ok(())
-        });
+            let chroma = &self.chroma;
+            let uploader = s.spawn(move || -> Result<()> {
+                for (chunks, embeddings) in upload_rx {
+                    chroma.add_chunks(&chunks, embeddings)?;
+                }
+                Ok(())
+            });
+
+            let mut batches = 0usize;
+            let mut embed_batch = |batch: Vec<Chunk>| -> Result<()> {
+                batches += 1;
+                println!("Batch {}", batches);
+                let texts: Vec<&str> = batch.iter().map(|c| c.text.as_str()).collect();
+                let embeddings = self.embedding_client.encode(&texts)?;
+                upload_tx.send((batch, embeddings)).map_err(|_| anyhow::anyhow!("Upload thread stopped"))
+            };
+
+            let result = (|| -> Result<()> {
+                let mut pending: Vec<Chunk> = Vec::with_capacity(batch_size);
+                for file_chunks in chunk_rx {
+                    chunk_count += file_chunks.len();
+                    pending.extend(file_chunks);
+                    while pending.len() >= batch_size {
+                        embed_batch(pending.drain(..batch_size).collect())?;
+                    }
+                }
+                if !pending.is_empty() {
+                    embed_batch(pending)?;
+                }
+                Ok(())
+            })();
 
-        for (i, batch) in batches.iter().enumerate() {
-            println!("Batch {}/{}", i + 1, total_batches);
-            let texts: Vec<&str> = batch.iter().map(|c| c.text.as_str()).collect();
-            let embeddings = self.embedding_client.encode(&texts)?;
-            tx.send((batch.to_vec(), embeddings)).ok();
-        }
+            // Surface the uploader's own error before a "stopped" error from sending
+            drop(upload_tx);
+            uploader.join().map_err(|_| anyhow::anyhow!("Upload thread panicked"))??;
+            result
+        })?;
 
-        drop(tx);
-        upload_thread.join().map_err(|_| anyhow::anyhow!("Upload thread panicked"))??;
+        println!("Generated {} chunks", chunk_count);
 
         println!("Done! Total chunks: {}", self.chroma.count());
         Ok(())
@@ -546,18 +589,21 @@ impl CodebaseIndexer {
             .follow_links(false)
             .into_iter()
             .filter_entry(|e| {
-                let path = e.path();
                 let is_dir = e.file_type().is_dir();
+                let name = e.file_name().to_str().unwrap_or("");
 
+                // Name-based checks are cheap; run them first so the gitignore globs
+                // only see entries that survive them
                 if is_dir {
-                    let name = e.file_name().to_str().unwrap_or("");
                     if ignore_dirs.contains(name) {
                         return false;
                     }
+                } else if !should_index_file(name) {
+                    return false;
                 }
 
                 if let Some(ref gi) = gitignore {
-                    if gi.matched(path, is_dir).is_ignore() {
+                    if gi.matched(e.path(), is_dir).is_ignore() {
                         return false;
                     }
                 }
@@ -568,15 +614,7 @@ impl CodebaseIndexer {
             let entry = match entry { Ok(e) => e, Err(_) => continue };
             if !entry.file_type().is_file() { continue; }
 
-            let path = entry.path();
-            if !should_index_file(path) { continue; }
-
-            // Skip large files (>10MB)
-            if let Ok(meta) = path.metadata() {
-                if meta.len() > 10 * 1024 * 1024 { continue; }
-            }
-
-            files.push(path.to_path_buf());
+            files.push(entry.into_path());
         }
 
         Ok(files)
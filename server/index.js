@@ -35,6 +35,7 @@ class VectorMCPServer {
     this.embeddingFunction = new TransformersEmbeddingFunction({
       model: "Xenova/all-MiniLM-L6-v2",
     });
+    this.collectionPromise = null;
 
     this.setupToolHandlers();
     this.setupErrorHandling();
@@ -212,6 +213,26 @@ class VectorMCPServer {
     });
   }
 
+  // ============================================================================
+  // HELPER: CACHED COLLECTION HANDLE
+  // ============================================================================
+
+  getCollection() {
+    // Resolve the collection once and reuse it, instead of a lookup round-trip per tool call
+    if (!this.collectionPromise) {
+      this.collectionPromise = this.chromaClient
+        .getCollection({
+          name: COLLECTION_NAME,
+          embeddingFunction: this.embeddingFunction,
+        })
+        .catch((error) => {
+          this.collectionPromise = null;
+          throw error;
+        });
+    }
+    return this.collectionPromise;
+  }
+
   // ============================================================================
   // HELPER: BUILD WHERE CLAUSE WITH BRANCH FILTER
   // ============================================================================
@@ -235,10 +256,7 @@ class VectorMCPServer {
     const { query, n_results = 10, filter_path } = args;
 
     try {
-      const collection = await this.chromaClient.getCollection({
-        name: COLLECTION_NAME,
-        embeddingFunction: this.embeddingFunction,
-      });
+      const collection = await this.getCollection();
 
       const pathFilter = filter_path
         ? { file_path: { $contains: filter_path } }
@@ -324,10 +342,7 @@ ${formattedResults}
     const { reference_path, n_results = 8 } = args;
 
     try {
-      const collection = await this.chromaClient.getCollection({
-        name: COLLECTION_NAME,
-        embeddingFunction: this.embeddingFunction,
-      });
+      const collection = await this.getCollection();
 
       // Get the reference file's content
       const where = this.buildWhereClause({ file_path: { $contains: reference_path } });
@@ -427,10 +442,7 @@ ${formattedResults}`,
     const { start_point, end_point, include_depth = 15 } = args;
 
     try {
-      const collection = await this.chromaClient.getCollection({
-        name: COLLECTION_NAME,
-        embeddingFunction: this.embeddingFunction,
-      });
+      const collection = await this.getCollection();
 
       // Build query to find execution path
       const pathQuery = end_point
@@ -506,10 +518,7 @@ ${formattedResults}`,
     const { target, context } = args;
 
     try {
-      const collection = await this.chromaClient.getCollection({
-        name: COLLECTION_NAME,
-        embeddingFunction: this.embeddingFunction,
-      });
+      const collection = await this.getCollection();
 
       // Build query for reproduction steps
       const reproQuery = `${target} entry point trigger reproduce how to reach navigation steps ${context || ''}`;
@@ -582,10 +591,7 @@ ${formattedResults}`,
     const { file_path, direction = "both", depth = 2 } = args;
 
     try {
-      const collection = await this.chromaClient.getCollection({
-        name: COLLECTION_NAME,
-        embeddingFunction: this.embeddingFunction,
-      });
+      const collection = await this.getCollection();
 
       // Get the target file
       const where = this.buildWhereClause({ file_path: { $contains: file_path } });
@@ -697,13 +703,13 @@ ${formattedResults}`,
 
   async getStats() {
     try {
-      const collection = await this.chromaClient.getCollection({
-        name: COLLECTION_NAME,
-        embeddingFunction: this.embeddingFunction,
-      });
+      const collection = await this.getCollection();
 
-      const count = await collection.count();
-      const freshness = await this.checkIndexFreshness(collection);
+      // Independent round-trips to ChromaDB (plus local git calls) - run them concurrently
+      const [count, freshness] = await Promise.all([
+        collection.count(),
+        this.checkIndexFreshness(collection),
+      ]);
 
       let freshnessWarning = "";
       if (freshness && freshness.stale) {